@@ -1,84 +1,326 @@
 import os
+import re
 import json
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+import decimal
+from datetime import date, datetime, timedelta
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, g, current_app
+from flask.json.provider import JSONProvider
+from flask_session import Session
+from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from flask_compress import Compress
+from jinja2 import FileSystemBytecodeCache
+from itsdangerous import URLSafeSerializer, BadData
+from werkzeug.http import http_date
+import orjson
+import redis
 import logging
+import logging.handlers
+import queue
+import atexit
+import threading
 import traceback
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 import secrets
-import random
 
-# Configure logging
+# Configure logging; records are handed to a background thread so request
+# threads never wait on console or file I/O
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_handlers = [logging.StreamHandler(), logging.FileHandler('app.log')]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+log_queue_handler = logging.handlers.QueueHandler(queue.Queue(-1))
+log_listener = None
+
+def start_log_listener():
+    """Start the thread that writes queued log records in this process"""
+    global log_listener
+    # Use a fresh queue so a forked worker doesn't replay the parent's records
+    log_queue_handler.queue = queue.Queue(-1)
+    log_listener = logging.handlers.QueueListener(log_queue_handler.queue, *log_handlers)
+    log_listener.start()
+
+def stop_log_listener():
+    """Flush queued log records before the process exits"""
+    if log_listener is not None:
+        log_listener.stop()
+
+start_log_listener()
+# Threads don't survive fork, so gunicorn workers forked from a preloaded
+# app need their own listener
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=start_log_listener)
+atexit.register(stop_log_listener)
+# The listener's handlers apply the full format, so the queue passes messages through
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('app.log')
-    ]
+    format='%(message)s',
+    handlers=[log_queue_handler]
 )
 
 logger = logging.getLogger(__name__)
 
+# Load .env before any configuration below is read from the environment
+load_dotenv()
+
+class ORJSONProvider(JSONProvider):
+    """JSON provider that uses orjson for jsonify and request parsing"""
+    sort_keys = True
+
+    @staticmethod
+    def _default(obj):
+        # Match Flask's default provider for the types orjson leaves to us
+        if isinstance(obj, date):
+            return http_date(obj)
+        if isinstance(obj, decimal.Decimal):
+            return str(obj)
+        if hasattr(obj, '__html__'):
+            return str(obj.__html__())
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def dumps(self, obj, **kwargs):
+        # Dates go through _default so they come out as HTTP dates, as in Flask
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            # orjson only supports two-space indentation
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self._default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
+app.json.sort_keys = False
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', secrets.token_hex(32))
 
+# Cache compiled templates on disk so new workers skip Jinja compilation
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+
+# Compress text responses; the test page with 10 questions is mostly text
+app.config['COMPRESS_MIMETYPES'] = ['text/html', 'text/css', 'application/json', 'application/javascript']
+app.config['COMPRESS_LEVEL'] = 6
+Compress(app)
+
 # Create data directory if it doesn't exist
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
 os.makedirs(DATA_DIR, exist_ok=True)
 
-# File paths
-QUESTIONS_FILE = os.path.join(DATA_DIR, 'questions.json')
-TESTS_FILE = os.path.join(DATA_DIR, 'tests.json')
+# Database configuration
+database_url = os.getenv('DATABASE_URL', 'sqlite:///' + os.path.join(DATA_DIR, 'maths_exam.db'))
+if database_url.startswith('postgres://'):
+    database_url = database_url.replace('postgres://', 'postgresql://', 1)
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# JSON columns are encoded and decoded with orjson
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'json_serializer': lambda obj: orjson.dumps(obj).decode(),
+    'json_deserializer': orjson.loads
+}
+if database_url.startswith('postgresql'):
+    # Reuse warm connections and replace ones the server has closed
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'].update({
+        'pool_size': 5,
+        'max_overflow': 5,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+        'pool_use_lifo': True
+    })
 
-def load_json_file(file_path, default=[]):
-    """Load data from a JSON file"""
-    try:
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as f:
-                return json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading {file_path}: {str(e)}")
-    return default
+db = SQLAlchemy(app)
+migrate = Migrate(app, db)
 
-def save_json_file(file_path, data):
-    """Save data to a JSON file"""
-    try:
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
-        return True
-    except Exception as e:
-        logger.error(f"Error saving to {file_path}: {str(e)}")
-        return False
+class Question(db.Model):
+    """A stored question; correct_answer is an index into options"""
+    id = db.Column(db.Integer, primary_key=True)
+    question_text = db.Column(db.String(500), nullable=False)
+    options = db.Column(db.JSON, nullable=False)
+    correct_answer = db.Column(db.Integer, nullable=False)
+    explanation = db.Column(db.Text, nullable=False)
+    times_used = db.Column(db.Integer, default=0)
+    last_used = db.Column(db.DateTime)
+
+    def to_dict(self):
+        """Return the question in the shape used by templates and grading"""
+        return {
+            'id': self.id,
+            'question_text': self.question_text,
+            'options': self.options,
+            'correct_answer': 'ABCD'[self.correct_answer],
+            'correct_text': self.options[self.correct_answer],
+            'explanation': self.explanation
+        }
 
-def init_data():
-    """Initialize data files if they don't exist"""
-    if not os.path.exists(QUESTIONS_FILE):
-        save_json_file(QUESTIONS_FILE, [])
-    if not os.path.exists(TESTS_FILE):
-        save_json_file(TESTS_FILE, [])
+class Test(db.Model):
+    """A test taken by a user; answers line up with questions_used"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(50), nullable=False, index=True)
+    score = db.Column(db.Integer, nullable=False, default=0)
+    total_questions = db.Column(db.Integer, nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    questions_used = db.Column(db.JSON, nullable=False)
+    answers = db.Column(db.JSON(none_as_null=True))
+    fallback = db.Column(db.Boolean, nullable=False, default=False)
 
-# Initialize data files
-init_data()
+    @property
+    def completed(self):
+        return self.answers is not None
+
+    @property
+    def percentage(self):
+        return (self.score / self.total_questions) * 100 if self.total_questions else 0.0
+
+OPENROUTER_API_URL = 'https://openrouter.ai/api/v1/chat/completions'
+
+# The prompt never changes, so encode the request body once
+OPENROUTER_REQUEST_BODY = orjson.dumps({
+    'model': 'deepseek/deepseek-r1:free',
+    'messages': [{
+        'role': 'user',
+        'content': '''Generate 10 multiple choice math questions for grade 7/8 students. 
+                Each question should have 4 options (A, B, C, D) and include an explanation.
+                Questions should cover topics like:
+                - Algebra (linear equations, expressions)
+                - Geometry (angles, area, volume)
+                - Statistics and probability
+                - Ratios and proportions
+                - Percentages and interest
+                - Basic trigonometry
+                
+                IMPORTANT: Return ONLY a JSON array of questions. Each question must be a JSON object with these exact fields:
+                {
+                    "question_text": "The question text",
+                    "options": ["Option A", "Option B", "Option C", "Option D"],
+                    "correct_answer": "A",  // Must be A, B, C, or D
+                    "explanation": "Step-by-step explanation of the solution"
+                }
+                
+                Do not include any additional text, explanations, or formatting. Return ONLY the JSON array.'''
+    }]
+})
+
+# Each test samples QUESTIONS_PER_TEST from a bank that is topped up in the
+# background until it holds QUESTION_BANK_TARGET questions
+QUESTIONS_PER_TEST = 10
+QUESTION_BANK_TARGET = int(os.getenv('QUESTION_BANK_TARGET', '50'))
+
+# Only one background refill of the question bank per worker at a time
+question_refill_lock = threading.Lock()
+
+# Fenced ```json block that models often wrap their answer in
+JSON_BLOCK_PATTERN = re.compile(r'```json\s*(.*?)```', re.DOTALL)
+
+# Decodes a JSON array in place, ignoring any text the model adds after it
+JSON_DECODER = json.JSONDecoder()
+
+# Shared HTTP session so OpenRouter connections are kept alive between calls.
+# Rate limiting and transient gateway errors are retried with backoff; slow
+# reads are not, so a slow response isn't waited on three times.
+# Only openrouter.ai is called, from at most one refill thread per worker.
+http_session = requests.Session()
+http_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=Retry(
+    total=2,
+    read=0,
+    backoff_factor=1,
+    status_forcelist=(429, 502, 503, 504),
+    allowed_methods=frozenset(['POST']),
+    raise_on_status=False
+)))
+# Headers that are the same on every call; the API key is added per call
+http_session.headers.update({
+    'Content-Type': 'application/json',
+    'HTTP-Referer': 'http://localhost:5000',
+    'X-Title': 'Maths Exam'
+})
+
+# Store sessions server-side so the cookie only carries the session id.
+# Redis is used when REDIS_URL is set, otherwise sessions live on disk.
+if os.getenv('REDIS_URL'):
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = redis.from_url(os.getenv('REDIS_URL'))
+else:
+    app.config['SESSION_TYPE'] = 'filesystem'
+    app.config['SESSION_FILE_DIR'] = os.path.join(DATA_DIR, 'sessions')
+app.config['SESSION_USE_SIGNER'] = True
+app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=12)
+Session(app)
+
+def init_db():
+    """Create database tables if they don't exist"""
+    with app.app_context():
+        db.create_all()
+
+# Schema is managed by `flask db upgrade`; `flask init-db` is for local setups
+@app.cli.command('init-db')
+def init_db_command():
+    """Create database tables without running migrations"""
+    init_db()
+    logger.info("Database tables created")
 
 # Add fromjson filter to Jinja2
 @app.template_filter('fromjson')
 def fromjson_filter(value):
-    return json.loads(value)
+    return [] if value is None else orjson.loads(value)
+
+# Error pages are the same for every request, so each is rendered once
+error_pages = {}
+
+def render_error_page(template):
+    """Render an error template outside the failing request and reuse it"""
+    if template not in error_pages:
+        # Use a path no route matches so no nav link is marked active
+        with app.test_request_context('/__error__'):
+            error_pages[template] = render_template(template)
+    return error_pages[template]
 
 # Error handler for 500 errors
 @app.errorhandler(500)
 def internal_error(error):
     logger.error(f"500 Error: {str(error)}")
     logger.error(traceback.format_exc())
-    return render_template('500.html'), 500
+    return render_error_page('500.html'), 500
 
 # Error handler for 404 errors
 @app.errorhandler(404)
 def not_found_error(error):
     logger.error(f"404 Error: {str(error)}")
-    return render_template('404.html'), 404
+    return render_error_page('404.html'), 404
+
+# Users are identified by a signed cookie that outlives the 12h session
+UID_COOKIE = 'uid'
+UID_COOKIE_MAX_AGE = 365 * 24 * 60 * 60
+
+def uid_serializer():
+    """Signer for the uid cookie, keyed on the app's current secret"""
+    return URLSafeSerializer(current_app.secret_key, salt='uid')
+
+def current_user_id():
+    """Return this browser's id from its signed cookie, creating one if needed"""
+    if 'uid' not in g:
+        try:
+            g.uid = uid_serializer().loads(request.cookies.get(UID_COOKIE, ''))
+        except BadData:
+            g.uid = 'u_' + secrets.token_urlsafe(12)
+            g.new_uid = True
+    return g.uid
+
+@app.after_request
+def set_uid_cookie(response):
+    """Send a newly created user id back as a long-lived cookie"""
+    if g.get('new_uid'):
+        response.set_cookie(
+            UID_COOKIE,
+            uid_serializer().dumps(g.uid),
+            max_age=UID_COOKIE_MAX_AGE,
+            httponly=True,
+            samesite='Lax'
+        )
+    return response
 
 @app.route('/')
 def index():
@@ -103,35 +345,24 @@ def start_test():
             return redirect(url_for('index'))
         
         try:
-            # Create a new test
-            tests = load_json_file(TESTS_FILE)
-            test_id = len(tests) + 1
-            test = {
-                'id': test_id,
-                'score': 0,
-                'total_questions': len(questions),
-                'percentage': 0.0,
-                'completed': False,
-                'questions_used': [q['id'] for q in questions],
-                'timestamp': datetime.utcnow().isoformat()
-            }
-            
-            # Save questions to questions.json
-            existing_questions = load_json_file(QUESTIONS_FILE)
-            for q in questions:
-                if 'id' not in q:
-                    q['id'] = len(existing_questions) + 1
-                    existing_questions.append(q)
-            save_json_file(QUESTIONS_FILE, existing_questions)
-            
-            # Save test to tests.json
-            tests.append(test)
-            save_json_file(TESTS_FILE, tests)
+            # Questions come from the bank or the fallback pool, so all have ids
+            test = Test(
+                user_id=current_user_id(),
+                score=0,
+                total_questions=len(questions),
+                questions_used=[q['id'] for q in questions],
+                fallback=all(q.get('fallback') for q in questions)
+            )
+            db.session.add(test)
+            db.session.flush()
+            test_id = test.id
+            db.session.commit()
             
             logger.info(f"Created new test with ID: {test_id}")
             return render_template('test.html', test_id=test_id, questions=questions)
             
         except Exception as e:
+            db.session.rollback()
             logger.error(f"Error creating test: {str(e)}", exc_info=True)
             flash('An error occurred while creating the test. Please try again.', 'error')
             return redirect(url_for('index'))
@@ -152,231 +383,275 @@ def submit_test():
             
         logger.info(f"Processing submission for test {test_id}")
         
-        # Get test from tests.json
-        tests = load_json_file(TESTS_FILE)
-        test = next((t for t in tests if t['id'] == test_id), None)
-        if not test:
-            logger.error(f"Test {test_id} not found")
+        # Get test from the database
+        test = db.session.get(Test, test_id)
+        if not test or test.user_id != current_user_id():
+            # Another user's test is reported as missing so ids can't be probed
+            logger.error(f"Test {test_id} not found for this user")
             return "Test not found", 404
+        if test.completed:
+            logger.error(f"Test {test_id} was already submitted")
+            return "Test already submitted", 409
             
         # Get answers from form
-        answers = {}
-        for key, value in request.form.items():
-            if key.startswith('answer_'):
-                question_id = int(key.replace('answer_', ''))
-                answers[question_id] = value
-                
-        logger.info(f"Collected answers: {answers}")
+        answers = {
+            int(key[len('answer_'):]): value
+            for key, value in request.form.items()
+            if key.startswith('answer_')
+        }
         
-        # Calculate score
-        score = 0
-        results = {}
+        logger.debug("Collected answers: %s", answers)
         
-        # Get questions from questions.json
-        questions = load_json_file(QUESTIONS_FILE)
-        for q_id in test['questions_used']:
-            question = next((q for q in questions if q['id'] == q_id), None)
-            if not question:
-                continue
-                
-            user_answer = answers.get(q_id)
-            correct = user_answer == question['correct_answer']
-            
-            if correct:
-                score += 1
-                
-            results[q_id] = {
-                'question': question['question'],
-                'user_answer': user_answer,
-                'correct_answer': question['correct_answer'],
-                'is_correct': correct,
-                'explanation': question['explanation']
-            }
-            
-        logger.info(f"Calculated score: {score}/{len(test['questions_used'])}")
+        # Store answers in question order and calculate score
+        test.answers = [answers.get(q_id) for q_id in test.questions_used]
+        score, results = grade_test(test)
         
-        # Update test with score
-        test['score'] = score
-        test['percentage'] = (score / len(test['questions_used'])) * 100
-        test['completed'] = True
+        logger.info(f"Calculated score: {score}/{test.total_questions}")
         
-        # Save updated test
-        tests = [t if t['id'] != test_id else test for t in tests]
-        save_json_file(TESTS_FILE, tests)
+        # Save updated test with score
+        test.score = score
+        db.session.commit()
         
-        # Save test results to session
-        session['test_results'] = {
-            'test_id': test_id,
-            'score': score,
-            'total_questions': len(test['questions_used']),
-            'percentage': test['percentage'],
-            'timestamp': test['timestamp'],
-            'results': results
-        }
+        # Only the test id goes in the session; results are rebuilt on demand
+        session['last_test_id'] = test_id
         
         return render_template('results.html', test=test, results=results)
         
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Unexpected error in submit_test: {str(e)}", exc_info=True)
         return "An error occurred while submitting the test", 500
 
 @app.route('/results')
 def results():
-    # Get test results from session
-    test_results = session.get('test_results')
-    if not test_results:
+    # Get the last submitted test id from session
+    test_id = session.get('last_test_id')
+    if not test_id:
         flash('No test results found.', 'error')
         return redirect(url_for('start_test'))
     
-    # Get the test from tests.json
-    tests = load_json_file(TESTS_FILE)
-    test = next((t for t in tests if t['id'] == test_results['test_id']), None)
-    if test is None:
+    # Get the test from the database
+    test = db.session.get(Test, test_id)
+    if test is None or test.user_id != current_user_id() or not test.completed:
         flash('Test not found', 'error')
         return redirect(url_for('index'))
     
-    return render_template('results.html', test=test, results=test_results['results'])
+    _, results = grade_test(test)
+    return render_template('results.html', test=test, results=results)
+
+@app.route('/history')
+def history():
+    """Page through the current user's completed tests, newest first"""
+    page_size = max(1, min(request.args.get('page_size', 20, type=int), 100))
+    cursor = request.args.get('cursor', type=int)
+
+    query = Test.query.filter(
+        Test.user_id == current_user_id(),
+        Test.answers.isnot(None)
+    )
+    if cursor is not None:
+        query = query.filter(Test.id < cursor)
+
+    # Fetch one extra row to know whether another page exists
+    tests = query.order_by(Test.id.desc()).limit(page_size + 1).all()
+    has_more = len(tests) > page_size
+    tests = tests[:page_size]
+
+    return jsonify({
+        'items': [
+            {
+                'id': test.id,
+                'timestamp': test.timestamp,
+                'score': test.score,
+                'total_questions': test.total_questions,
+                'percentage': test.percentage
+            }
+            for test in tests
+        ],
+        'next_cursor': tests[-1].id if has_more else None
+    })
+
+def grade_test(test):
+    """Score a test's stored answers and build the per-question results"""
+    # Index the test's questions by id
+    if test.fallback:
+        questions_by_id = FALLBACK_QUESTIONS_BY_ID
+    else:
+        questions_by_id = {
+            q.id: q.to_dict()
+            for q in Question.query.filter(Question.id.in_(test.questions_used))
+        }
+    
+    # The form posts the option text, so compare against the correct text
+    results = {
+        q_id: {
+            'question': question['question_text'],
+            'user_answer': user_answer,
+            'correct_answer': question['correct_text'],
+            'is_correct': user_answer == question['correct_text'],
+            'explanation': question['explanation']
+        }
+        for q_id, user_answer in zip(test.questions_used, test.answers)
+        if (question := questions_by_id.get(q_id))
+    }
+    score = sum(result['is_correct'] for result in results.values())
+    return score, results
 
 def generate_questions():
+    """Pick banked questions, or fallback ones while the bank is refilled"""
     try:
-        # Check if we have enough questions in questions.json
-        existing_questions = load_json_file(QUESTIONS_FILE)
-        if len(existing_questions) >= 10:
-            # Select 10 random questions
-            selected_questions = random.sample(existing_questions, 10)
-            return [{
-                'id': q['id'],
-                'question_text': q['question'],
+        # Keep topping the bank up in the background while it's below target
+        if Question.query.count() < QUESTION_BANK_TARGET:
+            start_question_refill()
+
+        # Let the database pick random questions if it has enough
+        selected_questions = Question.query.order_by(db.func.random()).limit(QUESTIONS_PER_TEST).all()
+        if len(selected_questions) == QUESTIONS_PER_TEST:
+            return [q.to_dict() for q in selected_questions]
+    except Exception as e:
+        logger.error(f"Unexpected error in generate_questions: {str(e)}", exc_info=True)
+
+    return get_fallback_questions()
+
+def start_question_refill():
+    """Start a background refill of the question bank unless one is running"""
+    if not os.getenv('OPENROUTER_API_KEY'):
+        logger.debug("Skipping question refill: OPENROUTER_API_KEY is not set")
+        return
+    if question_refill_lock.acquire(blocking=False):
+        try:
+            threading.Thread(target=refill_question_bank, daemon=True).start()
+        except Exception as e:
+            question_refill_lock.release()
+            logger.error(f"Could not start question refill: {str(e)}", exc_info=True)
+
+def refill_question_bank():
+    """Generate questions with OpenRouter and add the new ones to the bank"""
+    try:
+        with app.app_context():
+            questions = request_generated_questions()
+            if questions:
+                save_questions(questions)
+    finally:
+        question_refill_lock.release()
+
+def save_questions(questions):
+    """Insert questions whose text isn't in the bank yet"""
+    try:
+        # Skip questions the bank already has, found in one query
+        existing = {
+            text for (text,) in db.session.query(Question.question_text)
+            .filter(Question.question_text.in_([q['question_text'] for q in questions]))
+        }
+        rows = [
+            {
+                'question_text': q['question_text'],
                 'options': q['options'],
-                'correct_answer': q['correct_answer'],
+                'correct_answer': 'ABCD'.index(q['correct_answer']),
                 'explanation': q['explanation']
-            } for q in selected_questions]
+            }
+            for q in questions
+            if q['question_text'] not in existing
+        ]
+        db.session.bulk_insert_mappings(Question, rows)
+        db.session.commit()
+        logger.info(f"Added {len(rows)} questions to the bank")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error saving generated questions: {str(e)}", exc_info=True)
 
-        # If not enough questions, generate new ones using OpenRouter
+def request_generated_questions():
+    """Ask OpenRouter for 10 new questions; returns [] if that fails"""
+    try:
         api_key = os.getenv('OPENROUTER_API_KEY')
         if not api_key:
             logger.warning("Please set OPENROUTER_API_KEY environment variable")
-            return get_fallback_questions()
+            return []
 
-        logger.info("OpenRouter API key found in environment variables")
-        logger.info(f"API key (masked): {api_key[:3]}...{api_key[-4:]}")
+        logger.debug("OpenRouter API key found in environment variables")
 
-        headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json',
-            'HTTP-Referer': 'http://localhost:5000',
-            'X-Title': 'Maths Exam'
-        }
+        logger.debug("API request data: %s", OPENROUTER_REQUEST_BODY)
 
-        data = {
-            'model': 'deepseek/deepseek-r1:free',
-            'messages': [{
-                'role': 'user',
-                'content': '''Generate 10 multiple choice math questions for grade 7/8 students. 
-                Each question should have 4 options (A, B, C, D) and include an explanation.
-                Questions should cover topics like:
-                - Algebra (linear equations, expressions)
-                - Geometry (angles, area, volume)
-                - Statistics and probability
-                - Ratios and proportions
-                - Percentages and interest
-                - Basic trigonometry
-                
-                IMPORTANT: Return ONLY a JSON array of questions. Each question must be a JSON object with these exact fields:
-                {
-                    "question_text": "The question text",
-                    "options": ["Option A", "Option B", "Option C", "Option D"],
-                    "correct_answer": "A",  // Must be A, B, C, or D
-                    "explanation": "Step-by-step explanation of the solution"
-                }
-                
-                Do not include any additional text, explanations, or formatting. Return ONLY the JSON array.'''
-            }]
-        }
-
-        logger.debug(f"API request data: {json.dumps(data, indent=2)}")
-
-        response = requests.post(
-            'https://openrouter.ai/api/v1/chat/completions',
-            headers=headers,
-            json=data
+        response = http_session.post(
+            OPENROUTER_API_URL,
+            headers={'Authorization': f'Bearer {api_key}'},
+            data=OPENROUTER_REQUEST_BODY,
+            timeout=(5, 60)
         )
 
-        logger.debug(f"API response status code: {response.status_code}")
-        logger.debug(f"API response headers: {response.headers}")
-        logger.debug(f"API response text: {response.text}")
+        logger.debug("API response status code: %s", response.status_code)
+        logger.debug("API response headers: %s", response.headers)
 
         if response.status_code == 200:
             try:
-                response_data = response.json()
-                logger.debug(f"Raw API response: {json.dumps(response_data, indent=2)}")
+                response_data = orjson.loads(response.content)
+                logger.debug("Raw API response: %s", response_data)
                 
                 # Check if response has the expected structure
                 if 'choices' not in response_data:
                     logger.error("Invalid API response structure: missing 'choices'")
                     logger.error(f"Response keys: {list(response_data.keys())}")
                     logger.error(f"Full response: {json.dumps(response_data, indent=2)}")
-                    return get_fallback_questions()
+                    return []
                 
                 if not response_data['choices']:
                     logger.error("Empty choices array in API response")
                     logger.error(f"Full response: {json.dumps(response_data, indent=2)}")
-                    return get_fallback_questions()
+                    return []
                 
                 if 'message' not in response_data['choices'][0]:
                     logger.error("Invalid choice structure: missing 'message'")
                     logger.error(f"Choice structure: {json.dumps(response_data['choices'][0], indent=2)}")
-                    return get_fallback_questions()
+                    return []
                 
                 # Extract the generated text from the response
                 generated_text = response_data['choices'][0]['message']['content']
-                logger.debug(f"Generated text: {generated_text}")
+                logger.debug("Generated text: %s", generated_text)
                 
                 # Try to find JSON array in the text
                 try:
                     # First try to parse the entire text as JSON
-                    questions = json.loads(generated_text)
+                    questions = orjson.loads(generated_text)
                 except json.JSONDecodeError:
                     # If that fails, try to extract JSON from between ```json and ```
-                    if '```json' in generated_text and '```' in generated_text:
-                        json_str = generated_text.split('```json')[1].split('```')[0].strip()
-                        questions = json.loads(json_str)
+                    json_block = JSON_BLOCK_PATTERN.search(generated_text)
+                    if json_block:
+                        questions = orjson.loads(json_block.group(1))
                     else:
-                        # If no JSON markers, try to find the first [ and last ]
+                        # If no JSON markers, decode the array starting at the first [
                         start = generated_text.find('[')
-                        end = generated_text.rfind(']')
-                        if start != -1 and end != -1:
-                            json_str = generated_text[start:end+1]
-                            questions = json.loads(json_str)
-                        else:
+                        if start == -1:
                             raise json.JSONDecodeError("No JSON array found in response", generated_text, 0)
+                        questions, _ = JSON_DECODER.raw_decode(generated_text, start)
                 
                 # Validate the questions structure
                 if not isinstance(questions, list):
                     logger.error("Generated questions is not a list")
                     logger.error(f"Questions type: {type(questions)}")
-                    return get_fallback_questions()
+                    return []
                 
                 if len(questions) != 10:
                     logger.error(f"Expected 10 questions, got {len(questions)}")
-                    return get_fallback_questions()
+                    return []
                 
                 # Validate each question
                 for i, q in enumerate(questions):
                     if not all(key in q for key in ['question_text', 'options', 'correct_answer', 'explanation']):
                         logger.error(f"Question {i+1} missing required fields")
                         logger.error(f"Question structure: {json.dumps(q, indent=2)}")
-                        return get_fallback_questions()
+                        return []
                     
                     if not isinstance(q['options'], list) or len(q['options']) != 4:
                         logger.error(f"Question {i+1} has invalid options")
                         logger.error(f"Options: {q['options']}")
-                        return get_fallback_questions()
+                        return []
                     
                     if q['correct_answer'] not in ['A', 'B', 'C', 'D']:
                         logger.error(f"Question {i+1} has invalid correct_answer")
                         logger.error(f"Correct answer: {q['correct_answer']}")
-                        return get_fallback_questions()
+                        return []
+                    
+                    q['correct_text'] = correct_option_text(q)
                 
                 logger.info(f"Successfully generated and validated {len(questions)} questions")
                 return questions
@@ -384,97 +659,109 @@ def generate_questions():
             except json.JSONDecodeError as e:
                 logger.error(f"Error parsing generated text: {str(e)}")
                 logger.error(f"Generated text that failed to parse: {generated_text}")
-                return get_fallback_questions()
+                return []
             except Exception as e:
                 logger.error(f"Error processing API response: {str(e)}")
                 logger.error(f"Full response: {json.dumps(response_data, indent=2)}")
-                return get_fallback_questions()
+                return []
         else:
             logger.error(f"API request failed with status {response.status_code}")
             logger.error(f"Response: {response.text}")
-            return get_fallback_questions()
+            return []
 
     except Exception as e:
-        logger.error(f"Unexpected error in generate_questions: {str(e)}", exc_info=True)
-        return get_fallback_questions()
+        logger.error(f"Unexpected error in request_generated_questions: {str(e)}", exc_info=True)
+        return []
+
+def correct_option_text(question):
+    """Return the option text that the correct_answer letter points to"""
+    return question['options']['ABCD'.index(question['correct_answer'])]
+
+# Fallback question pool with grade 7/8 level questions, built once at import
+FALLBACK_QUESTIONS = (
+    {
+        "id": 1,
+        "question_text": "Solve for x: 2(3x - 5) = 4x + 8",
+        "options": ["9", "7", "5", "3"],
+        "correct_answer": "A",
+        "explanation": "To solve 2(3x - 5) = 4x + 8:\n1. Distribute: 6x - 10 = 4x + 8\n2. Subtract 4x: 2x - 10 = 8\n3. Add 10: 2x = 18\n4. Divide by 2: x = 9"
+    },
+    {
+        "id": 2,
+        "question_text": "What is the volume of a cylinder with radius 4 cm and height 10 cm? (Use π = 3.14)",
+        "options": ["502.4 cm³", "401.92 cm³", "314 cm³", "251.2 cm³"],
+        "correct_answer": "A",
+        "explanation": "Volume of cylinder = πr²h\n= 3.14 × 4² × 10\n= 3.14 × 16 × 10\n= 502.4 cm³"
+    },
+    {
+        "id": 3,
+        "question_text": "A bag contains 5 red marbles, 3 blue marbles, and 2 green marbles. What is the probability of drawing a blue marble?",
+        "options": ["3/10", "1/3", "3/8", "1/2"],
+        "correct_answer": "A",
+        "explanation": "Total marbles = 5 + 3 + 2 = 10\nBlue marbles = 3\nProbability = 3/10"
+    },
+    {
+        "id": 4,
+        "question_text": "If 3 pens cost $12, how much would 5 pens cost?",
+        "options": ["$20", "$18", "$15", "$24"],
+        "correct_answer": "A",
+        "explanation": "Cost per pen = $12 ÷ 3 = $4\nCost for 5 pens = 5 × $4 = $20"
+    },
+    {
+        "id": 5,
+        "question_text": "A shirt originally priced at $40 is on sale for 25% off. What is the sale price?",
+        "options": ["$30", "$35", "$32", "$28"],
+        "correct_answer": "A",
+        "explanation": "Discount = 25% of $40 = $10\nSale price = $40 - $10 = $30"
+    },
+    {
+        "id": 6,
+        "question_text": "In a right triangle, if one angle is 30°, what is the measure of the other acute angle?",
+        "options": ["60°", "45°", "90°", "30°"],
+        "correct_answer": "A",
+        "explanation": "Sum of angles in a triangle = 180°\nRight angle = 90°\nOther acute angle = 180° - 90° - 30° = 60°"
+    },
+    {
+        "id": 7,
+        "question_text": "Simplify: (2x² + 3x - 5) + (x² - 4x + 2)",
+        "options": ["3x² - x - 3", "3x² + 7x - 3", "x² - x - 3", "3x² - x + 3"],
+        "correct_answer": "A",
+        "explanation": "Combine like terms:\n(2x² + x²) + (3x - 4x) + (-5 + 2)\n= 3x² - x - 3"
+    },
+    {
+        "id": 8,
+        "question_text": "What is the area of a triangle with base 8 cm and height 6 cm?",
+        "options": ["24 cm²", "48 cm²", "32 cm²", "16 cm²"],
+        "correct_answer": "A",
+        "explanation": "Area of triangle = (base × height) ÷ 2\n= (8 × 6) ÷ 2\n= 48 ÷ 2\n= 24 cm²"
+    },
+    {
+        "id": 9,
+        "question_text": "If a recipe calls for 2 cups of flour for 12 cookies, how many cups are needed for 30 cookies?",
+        "options": ["5 cups", "4 cups", "6 cups", "3 cups"],
+        "correct_answer": "A",
+        "explanation": "Flour per cookie = 2 cups ÷ 12 = 1/6 cup\nFor 30 cookies = 30 × 1/6 = 5 cups"
+    },
+    {
+        "id": 10,
+        "question_text": "A bank offers 5% simple interest per year. If you deposit $1000, how much interest will you earn in 3 years?",
+        "options": ["$150", "$157.63", "$165", "$175"],
+        "correct_answer": "A",
+        "explanation": "Simple Interest = Principal × Rate × Time\n= $1000 × 0.05 × 3\n= $150"
+    }
+)
+
+for _q in FALLBACK_QUESTIONS:
+    _q['correct_text'] = correct_option_text(_q)
+    _q['fallback'] = True
+
+# Fallback ids overlap question table ids, so fallback tests resolve here
+FALLBACK_QUESTIONS_BY_ID = {q['id']: q for q in FALLBACK_QUESTIONS}
 
 def get_fallback_questions():
     """Return a set of predefined questions when API generation fails"""
     logger.info("Using fallback questions")
-    # Fallback question pool with grade 7/8 level questions
-    question_pool = [
-        {
-            "id": 1,
-            "question_text": "Solve for x: 2(3x - 5) = 4x + 8",
-            "options": ["9", "7", "5", "3"],
-            "correct_answer": "A",
-            "explanation": "To solve 2(3x - 5) = 4x + 8:\n1. Distribute: 6x - 10 = 4x + 8\n2. Subtract 4x: 2x - 10 = 8\n3. Add 10: 2x = 18\n4. Divide by 2: x = 9"
-        },
-        {
-            "id": 2,
-            "question_text": "What is the volume of a cylinder with radius 4 cm and height 10 cm? (Use π = 3.14)",
-            "options": ["502.4 cm³", "401.92 cm³", "314 cm³", "251.2 cm³"],
-            "correct_answer": "A",
-            "explanation": "Volume of cylinder = πr²h\n= 3.14 × 4² × 10\n= 3.14 × 16 × 10\n= 502.4 cm³"
-        },
-        {
-            "id": 3,
-            "question_text": "A bag contains 5 red marbles, 3 blue marbles, and 2 green marbles. What is the probability of drawing a blue marble?",
-            "options": ["3/10", "1/3", "3/8", "1/2"],
-            "correct_answer": "A",
-            "explanation": "Total marbles = 5 + 3 + 2 = 10\nBlue marbles = 3\nProbability = 3/10"
-        },
-        {
-            "id": 4,
-            "question_text": "If 3 pens cost $12, how much would 5 pens cost?",
-            "options": ["$20", "$18", "$15", "$24"],
-            "correct_answer": "A",
-            "explanation": "Cost per pen = $12 ÷ 3 = $4\nCost for 5 pens = 5 × $4 = $20"
-        },
-        {
-            "id": 5,
-            "question_text": "A shirt originally priced at $40 is on sale for 25% off. What is the sale price?",
-            "options": ["$30", "$35", "$32", "$28"],
-            "correct_answer": "A",
-            "explanation": "Discount = 25% of $40 = $10\nSale price = $40 - $10 = $30"
-        },
-        {
-            "id": 6,
-            "question_text": "In a right triangle, if one angle is 30°, what is the measure of the other acute angle?",
-            "options": ["60°", "45°", "90°", "30°"],
-            "correct_answer": "A",
-            "explanation": "Sum of angles in a triangle = 180°\nRight angle = 90°\nOther acute angle = 180° - 90° - 30° = 60°"
-        },
-        {
-            "id": 7,
-            "question_text": "Simplify: (2x² + 3x - 5) + (x² - 4x + 2)",
-            "options": ["3x² - x - 3", "3x² + 7x - 3", "x² - x - 3", "3x² - x + 3"],
-            "correct_answer": "A",
-            "explanation": "Combine like terms:\n(2x² + x²) + (3x - 4x) + (-5 + 2)\n= 3x² - x - 3"
-        },
-        {
-            "id": 8,
-            "question_text": "What is the area of a triangle with base 8 cm and height 6 cm?",
-            "options": ["24 cm²", "48 cm²", "32 cm²", "16 cm²"],
-            "correct_answer": "A",
-            "explanation": "Area of triangle = (base × height) ÷ 2\n= (8 × 6) ÷ 2\n= 48 ÷ 2\n= 24 cm²"
-        },
-        {
-            "id": 9,
-            "question_text": "If a recipe calls for 2 cups of flour for 12 cookies, how many cups are needed for 30 cookies?",
-            "options": ["5 cups", "4 cups", "6 cups", "3 cups"],
-            "correct_answer": "A",
-            "explanation": "Flour per cookie = 2 cups ÷ 12 = 1/6 cup\nFor 30 cookies = 30 × 1/6 = 5 cups"
-        },
-        {
-            "id": 10,
-            "question_text": "A bank offers 5% simple interest per year. If you deposit $1000, how much interest will you earn in 3 years?",
-            "options": ["$150", "$157.63", "$165", "$175"],
-            "correct_answer": "A",
-            "explanation": "Simple Interest = Principal × Rate × Time\n= $1000 × 0.05 × 3\n= $150"
-        }
-    ]
-    return question_pool
+    return list(FALLBACK_QUESTIONS)
 
 def load_env():
     """Load environment variables from .env file if it exists"""
@@ -490,7 +777,8 @@ def load_env():
     required_vars = {
         'FLASK_APP': 'app.py',
         'FLASK_DEBUG': '0',
-        'SECRET_KEY': os.getenv('SECRET_KEY', secrets.token_hex(32)),
+        # Keep the key chosen at startup rather than generating a second one
+        'SECRET_KEY': os.getenv('SECRET_KEY', app.config['SECRET_KEY']),
         'OPENROUTER_API_KEY': os.getenv('OPENROUTER_API_KEY'),
         'PORT': os.getenv('PORT', '5000')
     }
@@ -515,13 +803,8 @@ load_env()
 
 if __name__ == '__main__':
     try:
-        # Load environment variables
-        load_env()
-        
-        # Initialize data files
-        init_data()
-        
-        # Start the application
+        # Environment is loaded at import and the schema by `flask db upgrade`,
+        # so starting the server does no setup of its own
         port = int(os.environ.get('PORT', 5000))
         app.run(host='0.0.0.0', port=port)
     except Exception as e:
@@ -0,0 +1,44 @@
+"""store tests in database
+
+Revision ID: 9c4e2f7a1b3d
+Revises: 694eddd2c6d1
+Create Date: 2026-10-15 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e2f7a1b3d'
+down_revision = '694eddd2c6d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Generated explanations can run past 500 characters
+    with op.batch_alter_table('question') as batch_op:
+        batch_op.alter_column('explanation',
+            existing_type=sa.String(length=500),
+            type_=sa.Text(),
+            existing_nullable=False)
+
+    # Submitted answers, fallback marker and per-user lookups for tests
+    with op.batch_alter_table('test') as batch_op:
+        batch_op.add_column(sa.Column('answers', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('fallback', sa.Boolean(), nullable=False, server_default=sa.false()))
+        batch_op.create_index('ix_test_user_id', ['user_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('test') as batch_op:
+        batch_op.drop_index('ix_test_user_id')
+        batch_op.drop_column('fallback')
+        batch_op.drop_column('answers')
+
+    with op.batch_alter_table('question') as batch_op:
+        batch_op.alter_column('explanation',
+            existing_type=sa.Text(),
+            type_=sa.String(length=500),
+            existing_nullable=False)
@@ -0,0 +1,75 @@
+"""use json columns
+
+Revision ID: b81d5e0c6a27
+Revises: 9c4e2f7a1b3d
+Create Date: 2026-10-15 11:05:00.000000
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81d5e0c6a27'
+down_revision = '9c4e2f7a1b3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Early rows stored options comma-separated (e.g. "9,7,5,3"); rewrite
+    # them as JSON arrays so every value casts cleanly below
+    bind = op.get_bind()
+    question = sa.table('question', sa.column('id', sa.Integer), sa.column('options', sa.String))
+    legacy_rows = bind.execute(
+        sa.select(question.c.id, question.c.options).where(~question.c.options.startswith('['))
+    ).all()
+    for row in legacy_rows:
+        bind.execute(
+            question.update()
+            .where(question.c.id == row.id)
+            .values(options=json.dumps([option.strip() for option in row.options.split(',')]))
+        )
+
+    # All values are now JSON-encoded text, so they cast as-is
+    with op.batch_alter_table('question') as batch_op:
+        batch_op.alter_column('options',
+            existing_type=sa.String(length=500),
+            type_=sa.JSON(),
+            existing_nullable=False,
+            postgresql_using='options::json')
+
+    with op.batch_alter_table('test') as batch_op:
+        batch_op.alter_column('questions_used',
+            existing_type=sa.Text(),
+            type_=sa.JSON(),
+            existing_nullable=False,
+            postgresql_using='questions_used::json')
+        batch_op.alter_column('answers',
+            existing_type=sa.Text(),
+            type_=sa.JSON(),
+            existing_nullable=True,
+            postgresql_using='answers::json')
+
+
+def downgrade():
+    with op.batch_alter_table('test') as batch_op:
+        batch_op.alter_column('answers',
+            existing_type=sa.JSON(),
+            type_=sa.Text(),
+            existing_nullable=True,
+            postgresql_using='answers::text')
+        batch_op.alter_column('questions_used',
+            existing_type=sa.JSON(),
+            type_=sa.Text(),
+            existing_nullable=False,
+            postgresql_using='questions_used::text')
+
+    with op.batch_alter_table('question') as batch_op:
+        batch_op.alter_column('options',
+            existing_type=sa.JSON(),
+            type_=sa.String(length=500),
+            existing_nullable=False,
+            postgresql_using='options::text')